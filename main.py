@@ -1,13 +1,60 @@
+import os
+import hashlib
+import inspect
 import streamlit as st
 import pandas as pd
 
+# Copy-on-Write statt defensiver Kopien (ab pandas 3.0 immer aktiv)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
 # Gecachte Ladefunktion
 DATA_PATH = "data/esg_dataset.xlsx"
+CACHE_DIR = ".cache"
+
+def _excel_engine() -> str:
+    """Calamine (Rust) bevorzugen, sonst openpyxl."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return "openpyxl"
+    return "calamine"
+
+def _write_parquet(df: pd.DataFrame, path: str) -> None:
+    """Einmalige Ablage als Parquet; gemischte Objektspalten werden als Text gespeichert."""
+    mixed = {c: "string" for c in df.columns if df[c].dtype == object}
+    # Über eine temporäre Datei schreiben, damit nie eine halb geschriebene Kopie liegen bleibt
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        df.astype(mixed).to_parquet(tmp_path, index=False, compression="zstd")
+        os.replace(tmp_path, path)
+    except (ImportError, OSError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _read_parquet(path: str) -> pd.DataFrame | None:
+    """Parquet-Datei lesen; None, falls sie fehlt oder beschädigt ist."""
+    try:
+        return pd.read_parquet(path)
+    except (ImportError, OSError, ValueError):
+        return None
 
-@st.cache_data(show_spinner=False)
 def load_excel(path: str) -> pd.DataFrame:
-    """Laden und cachen der Datei."""
-    return pd.read_excel(path, engine="openpyxl")
+    """Laden der Datei (Parquet-Kopie bevorzugt, sofern aktuell)."""
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.exists(parquet_path) and (
+        not os.path.exists(path) or os.path.getmtime(parquet_path) >= os.path.getmtime(path)
+    ):
+        df = _read_parquet(parquet_path)
+        if df is not None:
+            return df
+
+    df = pd.read_excel(path, engine=_excel_engine())
+    _write_parquet(df, parquet_path)
+    return df
 
 # Grundlayout
 st.set_page_config(
@@ -24,24 +71,49 @@ with st.sidebar:
 from modules.filters import filter_data
 from modules.calculations import calculate_returns
 
-# Analysefunktionen
-from modules.governance_impact import governance_vs_rendite
-from modules.governance_analysis import governance_analysis_view
-from modules.correlation import correlation_analysis_view
-from modules.benchmark import benchmark_governance
-from modules.timeseries import governance_timeseries
+def _cache_key(*paths: str) -> str:
+    """Schlüssel aus Dateiname, Änderungszeit und Größe der Quelldateien."""
+    h = hashlib.sha1()
+    for p in paths:
+        info = os.stat(p)
+        h.update(f"{os.path.abspath(p)}:{info.st_mtime_ns}:{info.st_size}".encode())
+    return h.hexdigest()
+
+def _prune_cache(keep: str) -> None:
+    """Veraltete Parquet-Dateien im Cache-Verzeichnis entfernen."""
+    try:
+        for name in os.listdir(CACHE_DIR):
+            path = os.path.join(CACHE_DIR, name)
+            if name.endswith(".parquet") and path != keep:
+                os.remove(path)
+    except OSError:
+        pass
+
+@st.cache_data(show_spinner=False)
+def load_prepared(path: str) -> pd.DataFrame:
+    """Laden, Vorverarbeitung und Jahresrenditen; Ergebnis wird unter .cache/ als Parquet abgelegt."""
+    source = path if os.path.exists(path) else os.path.splitext(path)[0] + ".parquet"
+    # Änderungen an Datei oder Vorverarbeitung machen den Cache ungültig
+    key = _cache_key(source, inspect.getfile(filter_data), inspect.getfile(calculate_returns))
+    cache_path = os.path.join(CACHE_DIR, f"{key}.parquet")
+    # Beschädigte Cache-Datei wird neu berechnet und überschrieben
+    df = _read_parquet(cache_path) if os.path.exists(cache_path) else None
+    if df is None:
+        df = calculate_returns(filter_data(load_excel(path)))
+        _write_parquet(df, cache_path)
+        _prune_cache(cache_path)
+
+    # Versionskennung als günstiger Cache-Schlüssel für die Analysemodule
+    df.attrs["version"] = key
+    return df
 
 # Fehlermeldung bei nicht vorhandenem Dataset
 try:
-    df_raw = load_excel(DATA_PATH)
+    df = load_prepared(DATA_PATH)
 except FileNotFoundError:
     st.error(f"Die Datenquelle '{DATA_PATH}' ist nicht verfügbar. Bitte stellen Sie sicher, dass die Datei im Repository vorhanden ist.")
     st.stop()
 
-# Vorverarbeitung und Aggregation
-df_filtered = filter_data(df_raw)
-df = calculate_returns(df_filtered)
-
 # Tabstruktur
 tabs = st.tabs([
     "Governance-Scores und Renditeentwicklung im Vergleich",
@@ -51,17 +123,23 @@ tabs = st.tabs([
     "Renditeentwicklung im Zeitverlauf"
 ])
 
+# Analysefunktionen erst im jeweiligen Tab importieren (plotly/scipy nach dem Datenladen)
 with tabs[0]:
+    from modules.governance_impact import governance_vs_rendite
     governance_vs_rendite(df)
 
 with tabs[1]:
+    from modules.governance_analysis import governance_analysis_view
     governance_analysis_view(df)
 
 with tabs[2]:
+    from modules.correlation import correlation_analysis_view
     correlation_analysis_view(df)
 
 with tabs[3]:
+    from modules.benchmark import benchmark_governance
     benchmark_governance(df)
 
 with tabs[4]:
+    from modules.timeseries import governance_timeseries
     governance_timeseries(df)
\ No newline at end of file
@@ -1,7 +1,14 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
+import plotly.graph_objects as go
+from modules.calculations import data_version
+
+@st.cache_data(show_spinner=False)
+def _year_sector_medians(_df: pd.DataFrame, version: str) -> pd.Series:
+    """
+    Median-Score je Jahr und Branche, einmal für alle Jahre berechnet.
+    """
+    return _df.groupby(["Year", "Sektor"], sort=False, observed=True)["GovernancePillarScore"].median()
 
 def benchmark_governance(df: pd.DataFrame) -> None:
     """
@@ -16,7 +23,7 @@ def benchmark_governance(df: pd.DataFrame) -> None:
     selected_year = st.selectbox("Analysejahr auswählen", jahre)
 
     # Datenfilterung nach Jahr
-    df_filtered = df[df["Year"] == selected_year].copy()
+    df_filtered = df[df["Year"] == selected_year]
 
     # Prüfen auf notwendige Spalten
     notwendige_spalten = ["Company Name", "Sektor", "GovernancePillarScore"]
@@ -24,24 +31,30 @@ def benchmark_governance(df: pd.DataFrame) -> None:
         st.error("Es fehlen eine oder mehrere erforderliche Spalten im Datensatz.")
         return
 
-    # Median-Score je Branche
-    mediane = df_filtered.groupby("Sektor")["GovernancePillarScore"].median()
-
-    # Abweichung zum Median
-    df_filtered["GovernanceDeltaToMedian"] = df_filtered.apply(
-        lambda row: row["GovernancePillarScore"] - mediane.get(row["Sektor"], np.nan),
-        axis=1
+    # Abweichung zum Median-Score der Branche im gewählten Jahr
+    mediane = _year_sector_medians(df, data_version(df))
+    # Jahre ohne Branchenangabe fehlen im Index, die Abweichung bleibt dann leer
+    mediane = mediane[mediane.index.get_level_values("Year") == selected_year].droplevel("Year")
+    df_filtered["GovernanceDeltaToMedian"] = (
+        df_filtered["GovernancePillarScore"].to_numpy()
+        - mediane.reindex(df_filtered["Sektor"].to_numpy()).to_numpy()
     )
 
-    # Boxplot
-    fig = px.box(
-        df_filtered,
-        x="Sektor",
-        y="GovernancePillarScore",
-        points="all",
+    # Boxplot aus vorab berechneten Quartilen (statt Übertragung aller Einzelwerte)
+    fig = go.Figure()
+    for sektor, scores in df_filtered.groupby("Sektor", sort=False, observed=True)["GovernancePillarScore"]:
+        q1, median, q3 = scores.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        inside = scores[scores.between(q1 - 1.5 * iqr, q3 + 1.5 * iqr)]
+        fig.add_trace(go.Box(
+            x=[sektor], name=sektor,
+            q1=[q1], median=[median], q3=[q3],
+            lowerfence=[inside.min()], upperfence=[inside.max()]
+        ))
+    fig.update_layout(
         title=f"Verteilung der Governance-Scores nach Branche ({selected_year})",
-        labels={"GovernancePillarScore": "Governance Score"},
-        color="Sektor"
+        xaxis_title="Sektor",
+        yaxis_title="Governance Score"
     )
 
     st.plotly_chart(fig, use_container_width=True)
@@ -52,38 +65,33 @@ def benchmark_governance(df: pd.DataFrame) -> None:
         base_cols = [
             "Company Name", "Sektor", "GovernancePillarScore", "GovernanceDeltaToMedian"
         ]
-        table_df = df_filtered[base_cols].copy()
+        table_df = df_filtered[base_cols]
 
         # Bereinigung jeses Unternehmen nur ein Eintrag (Mittelwert)
         only_once = st.checkbox("Je Unternehmen nur eine Zeile (Mittelwert)", value=True)
         if only_once:
-            grouped = (table_df
-                       .groupby(["Company Name", "Sektor"], as_index=False)
-                       .agg({
-                           "GovernancePillarScore": "mean",
-                           "GovernanceDeltaToMedian": "mean"
-                       }))
-            grouped["Anzahl_Einträge"] = table_df.groupby(["Company Name", "Sektor"]).size().values
-            table_df = grouped
+            table_df = (table_df
+                        .groupby(["Company Name", "Sektor"], as_index=False, sort=False, observed=True)
+                        .agg(
+                            GovernancePillarScore=("GovernancePillarScore", "mean"),
+                            GovernanceDeltaToMedian=("GovernanceDeltaToMedian", "mean"),
+                            Anzahl_Einträge=("GovernancePillarScore", "size")
+                        ))
 
         # Suche nach Unternehmen oder Sektor
         q = st.text_input("Suche (Unternehmen/Sektor)", value="")
         if q:
+            # Literale Teilstring-Suche; bei Kategorien nur über die eindeutigen Werte
             mask = (
-                table_df["Company Name"].str.contains(q, case=False, na=False)
-                | table_df["Sektor"].str.contains(q, case=False, na=False)
+                table_df["Company Name"].str.contains(q, case=False, regex=False, na=False)
+                | table_df["Sektor"].str.contains(q, case=False, regex=False, na=False)
             )
             table_df = table_df[mask]
 
-        # Sortierung nach Abweichung vor der Formatierung
+        # Sortierung nach Abweichung
         if "GovernanceDeltaToMedian" in table_df.columns:
             table_df = table_df.sort_values("GovernanceDeltaToMedian", ascending=False)
 
-        # Nachkommastellen ausblenden
-        for c in ["GovernancePillarScore", "GovernanceDeltaToMedian"]:
-            if c in table_df.columns:
-                table_df[c] = table_df[c].apply(lambda x: "" if pd.isna(x) else f"{x:.0f}")
-
         # Spaltennamen für die Darstellung
         display_df = table_df.rename(columns={
             "Company Name": "Unternehmen",
@@ -91,6 +99,13 @@ def benchmark_governance(df: pd.DataFrame) -> None:
             "GovernanceDeltaToMedian": "Abweichung"
         })
 
-        # Index ausblenden
+        # Index ausblenden, Nachkommastellen nur in der Anzeige ausblenden (Werte bleiben numerisch)
         display_df = display_df.reset_index(drop=True)
-        st.dataframe(display_df, use_container_width=True)
+        st.dataframe(
+            display_df,
+            use_container_width=True,
+            column_config={
+                "Governance Score": st.column_config.NumberColumn(format="%.0f"),
+                "Abweichung": st.column_config.NumberColumn(format="%.0f")
+            }
+        )
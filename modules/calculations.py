@@ -1,89 +1,131 @@
 import pandas as pd
 import numpy as np
 
+def data_version(df: pd.DataFrame) -> str:
+    """
+    Versionskennung des Datensatzes für Cache-Schlüssel (sonst Hash über den Inhalt).
+    """
+    version = df.attrs.get("version")
+    if version is None:
+        return str(pd.util.hash_pandas_object(df, index=False).sum())
+    # attrs überdauern Filterungen: Zeilenzahl und Indexgrenzen unterscheiden Teilmengen
+    bounds = (df.index[0], df.index[-1]) if len(df) else ()
+    return f"{version}:{len(df)}:{bounds}:{tuple(df.columns)}"
+
+def grouped_centered_sums(keys: pd.Series, x: pd.Series, y: pd.Series) -> pd.DataFrame:
+    """
+    Anzahl, Mittelwerte, Spannweite von x und zentrierte Quadratsummen (sxx, syy, sxy) je Gruppe.
+    """
+    x = x.astype("float64")
+    y = y.astype("float64")
+
+    # Abweichungen vom Gruppenmittel, danach Summen je Gruppe in einem Durchlauf
+    dx = x - x.groupby(keys, sort=False, observed=True).transform("mean")
+    dy = y - y.groupby(keys, sort=False, observed=True).transform("mean")
+    return (
+        pd.DataFrame({"x": x, "y": y, "sxx": dx * dx, "syy": dy * dy, "sxy": dx * dy})
+        .groupby(keys, sort=False, observed=True)
+        .agg(n=("x", "size"), x_mean=("x", "mean"), y_mean=("y", "mean"),
+             x_min=("x", "min"), x_max=("x", "max"),
+             sxx=("sxx", "sum"), syy=("syy", "sum"), sxy=("sxy", "sum"))
+    )
+
+def pearson_from_sums(n, sxx, syy, sxy) -> tuple:
+    """
+    Pearson-Korrelation r und zweiseitiger p-Wert aus zentrierten Quadratsummen.
+    """
+    # scipy wird nur von den Analysefunktionen benötigt, daher Import erst hier
+    from scipy.stats import t as t_dist
+
+    n = np.asarray(n, dtype="float64")
+    sxx = np.asarray(sxx, dtype="float64")
+    syy = np.asarray(syy, dtype="float64")
+    sxy = np.asarray(sxy, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0)
+        dof = n - 2
+        t_stat = r * np.sqrt(dof / (1.0 - r * r))
+        p = 2 * t_dist.sf(np.abs(t_stat), dof)
+    return r, p
+
 def calculate_returns(df: pd.DataFrame, min_months_per_year: int = 12, partial_policy: str = "strict", min_months_for_partial: int = 6) -> pd.DataFrame:
     """
     Berechnung der prozentualen Jahresrendite aus Monatsdaten.
     """
-    df = df.copy()
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '', regex=False)
+    df = df.set_axis(df.columns.str.strip().str.replace('\ufeff', '', regex=False), axis=1)
 
     req = ["Company Name", "Date", "Close Price (USD)"]
     missing = [c for c in req if c not in df.columns]
     if missing:
         raise KeyError(f"Fehlende Spalten: {', '.join(missing)}")
 
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    # Typumwandlung nur, falls filter_data sie nicht bereits erledigt hat
+    if not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
     df = df.dropna(subset=["Date"])
-    df["Close Price (USD)"] = pd.to_numeric(df["Close Price (USD)"], errors="coerce")
+    if not pd.api.types.is_numeric_dtype(df["Close Price (USD)"]):
+        df["Close Price (USD)"] = pd.to_numeric(df["Close Price (USD)"], errors="coerce")
     df = df[df["Close Price (USD)"] > 0].sort_values(["Company Name", "Date"])
 
-    # Eindeutigkeit je Monat
-    df["Month"] = df["Date"].dt.to_period("M")
+    # Eindeutigkeit je Monat (Monatsindex Jahr * 12 + Monat)
+    df["Month"] = (df["Date"].dt.year * 12 + df["Date"].dt.month).astype("int32")
     df = df.drop_duplicates(subset=["Company Name", "Month"], keep="first")
 
-    # Monatsrenditen je Kalenderjahr
-    df["Year"] = df["Date"].dt.year
-    df["PeriodReturn"] = (
-        df.groupby(["Company Name", "Year"], sort=False)["Close Price (USD)"].pct_change()
-    )
-
-    # Jahresaggregation
-    def _annual_from_group(g: pd.DataFrame) -> float:
-        # Monate und Renditen ermitteln
-        months = g["Month"].sort_values().unique()
-        n_months = len(months)
-        s = g["PeriodReturn"].dropna()
-        n_returns = s.size
-
-        # Vollständiges Jahr vorhanden?
-        full_year = (n_months >= min_months_per_year) and (n_returns >= max(1, min_months_per_year - 1))
-        total_factor = (1.0 + s).prod() if n_returns > 0 else np.nan
-
-        if partial_policy == "strict":
-            if not full_year:
-                return np.nan
-            return total_factor - 1.0
-
-        elif partial_policy == "ytd_partial":
-
-            if full_year:
-                return total_factor - 1.0
-            if n_months < max(2, min_months_for_partial) or n_returns < 1:
-                return np.nan
-            return total_factor - 1.0
-
-        elif partial_policy == "annualize_by_span":
-
-            if full_year:
-                return total_factor - 1.0
-            if n_months < max(2, min_months_for_partial) or n_returns < 1:
-                return np.nan
-            # Spannweite in Monaten zwischen erstem und letztem Monat
-            m0, m1 = months[0], months[-1]
-            try:
-                months_span = (m1.year - m0.year) * 12 + (m1.month - m0.month)
-            except AttributeError:
-                # Fallback für PeriodArray mit .ordinal
-                months_span = m1.ordinal - m0.ordinal
-            if months_span <= 0:
-                return np.nan
-            monthly_factor = total_factor ** (1.0 / months_span)
-            return monthly_factor ** 12 - 1.0
-
-        else:
-            raise ValueError("partial_policy must be 'strict', 'ytd_partial', or 'annualize_by_span'")
-
-    annual = (
-        df.groupby(["Company Name", "Year"], sort=False)
-          .apply(_annual_from_group)
-          .reset_index(name="AnnualReturn")
-    )
-    annual["AnnualReturnPct"] = annual["AnnualReturn"] * 100.0
-
-    out = df.merge(
-        annual[["Company Name", "Year", "AnnualReturnPct"]],
-        on=["Company Name", "Year"], how="left"
-    ).drop(columns=["PeriodReturn", "Month"])
+    # Kalenderjahr
+    df["Year"] = df["Date"].dt.year.astype("int16")
+    if df.empty:
+        return df.drop(columns=["Month"]).assign(AnnualReturnPct=np.float32(np.nan)).reset_index(drop=True)
+
+    # Gruppengrenzen (Unternehmen, Jahr): nach der Sortierung liegen Gruppen zusammenhängend
+    codes, _ = pd.factorize(df["Company Name"])
+    years = df["Year"].to_numpy()
+    months = df["Month"].to_numpy()
+    is_start = np.r_[True, (codes[1:] != codes[:-1]) | (years[1:] != years[:-1])]
+    starts = np.flatnonzero(is_start)
+    ends = np.r_[starts[1:], len(df)]
+    group_ids = np.cumsum(is_start) - 1
+
+    # Monatsrenditen je Kalenderjahr (erste Zeile jeder Gruppe ohne Rendite)
+    price = df["Close Price (USD)"].to_numpy(dtype="float64")
+    period_return = np.full(len(df), np.nan)
+    period_return[1:] = price[1:] / price[:-1] - 1.0
+    period_return[is_start] = np.nan
+    has_return = ~np.isnan(period_return)
+
+    # Jahresaggregation über die Gruppengrenzen
+    n_months = ends - starts
+    n_returns = np.add.reduceat(has_return, starts)
+    total_factor = np.multiply.reduceat(np.where(has_return, 1.0 + period_return, 1.0), starts)
+    total_factor = np.where(n_returns > 0, total_factor, np.nan)
+
+    # Vollständiges Jahr bzw. ausreichend Monate für Teiljahre vorhanden?
+    full_year = (n_months >= min_months_per_year) & (n_returns >= max(1, min_months_per_year - 1))
+    partial_ok = (n_months >= max(2, min_months_for_partial)) & (n_returns >= 1)
+
+    if partial_policy == "strict":
+        annual = np.where(full_year, total_factor - 1.0, np.nan)
+
+    elif partial_policy == "ytd_partial":
+        annual = np.where(full_year | partial_ok, total_factor - 1.0, np.nan)
+
+    elif partial_policy == "annualize_by_span":
+
+        # Spannweite in Monaten zwischen erstem und letztem Monat
+        months_span = (months[ends - 1] - months[starts]).astype("float64")
+        months_span[months_span <= 0] = np.nan
+
+        # Annualisierung nur für unvollständige Jahre mit ausreichender Monatsanzahl
+        monthly_factor = total_factor ** (1.0 / months_span)
+        annualized = np.where(partial_ok, monthly_factor ** 12 - 1.0, np.nan)
+        annual = np.where(full_year, total_factor - 1.0, annualized)
+
+    else:
+        raise ValueError("partial_policy must be 'strict', 'ytd_partial', or 'annualize_by_span'")
+
+    # Jahreswerte über die Gruppennummer auf die Monatszeilen übertragen
+    annual_rows = np.where(codes >= 0, annual[group_ids] * 100.0, np.nan)
+    df["AnnualReturnPct"] = annual_rows.astype("float32")
+
+    out = df.drop(columns=["Month"]).reset_index(drop=True)
 
     return out
\ No newline at end of file
@@ -1,7 +1,28 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-from scipy.stats import pearsonr
+import plotly.graph_objects as go
+from modules.calculations import grouped_centered_sums, pearson_from_sums
+
+@st.cache_data(show_spinner=False)
+def _compute_company_corrs(df_small: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pearson-Korrelation je Unternehmen (mindestens 30 Beobachtungen), absteigend sortiert.
+    """
+    sums = grouped_centered_sums(
+        df_small["Company Name"], df_small["GovernancePillarScore"], df_small["AnnualReturnPct"]
+    )
+    sums = sums[sums["n"] >= 30]
+
+    r, p = pearson_from_sums(sums["n"], sums["sxx"], sums["syy"], sums["sxy"])
+
+    return pd.DataFrame({
+        "Unternehmen": sums.index.to_numpy(),
+        "Korrelationskoeffizient": np.round(r, 3),
+        "p-Wert": np.round(p, 4),
+        "Anzahl Beobachtungen": sums["n"].to_numpy()
+    }).sort_values(by="Korrelationskoeffizient", ascending=False)
 
 def correlation_analysis_view(df: pd.DataFrame):
     """
@@ -14,28 +35,18 @@ def correlation_analysis_view(df: pd.DataFrame):
     # Datenbereinigung
     cols_required = ["Company Name", "GovernancePillarScore", "AnnualReturnPct"]
     df = df.dropna(subset=cols_required)
-    df["GovernancePillarScore"] = pd.to_numeric(df["GovernancePillarScore"], errors="coerce")
-    df["AnnualReturnPct"] = pd.to_numeric(df["AnnualReturnPct"], errors="coerce")
+    for col in ("GovernancePillarScore", "AnnualReturnPct"):
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
     df = df.dropna(subset=["GovernancePillarScore", "AnnualReturnPct"])
 
     # Korrelationen je Unternehmen
-    result = []
-    for name, group in df.groupby("Company Name"):
-        if len(group) >= 30:
-            r, p = pearsonr(group["GovernancePillarScore"], group["AnnualReturnPct"])
-            result.append({
-                "Unternehmen": name,
-                "Korrelationskoeffizient": round(r, 3),
-                "p-Wert": round(p, 4),
-                "Anzahl Beobachtungen": len(group)
-            })
-
-    if not result:
+    df_corr = _compute_company_corrs(df[cols_required])
+
+    if df_corr.empty:
         st.warning("Nicht genügend Daten zur Berechnung von Korrelationen.")
         return
 
-    df_corr = pd.DataFrame(result).sort_values(by="Korrelationskoeffizient", ascending=False)
-
     # Filterung
     st.markdown("### Korrelationsbereich auswählen")
     corr_range = st.slider("Korrelation (r)", -1.0, 1.0, (-1.0, 1.0), step=0.05)
@@ -75,13 +86,20 @@ def correlation_analysis_view(df: pd.DataFrame):
             subset,
             x="GovernancePillarScore",
             y="AnnualReturnPct",
-            trendline="ols",
             title=f"{name}: Governance-Score vs. Rendite",
             labels={
                 "GovernancePillarScore": "Governance-Score",
                 "AnnualReturnPct": "Rendite (%)"
             }
         )
+
+        # Regressionsgerade
+        xx = subset["GovernancePillarScore"].to_numpy(dtype="float64")
+        yy = subset["AnnualReturnPct"].to_numpy(dtype="float64")
+        if np.unique(xx).size >= 2:
+            slope, intercept = np.polyfit(xx, yy, 1)
+            x_line = np.array([xx.min(), xx.max()])
+            fig.add_trace(go.Scatter(x=x_line, y=intercept + slope * x_line, mode="lines", showlegend=False))
         fig.update_layout(height=400)
         st.plotly_chart(fig, use_container_width=True)
 
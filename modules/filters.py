@@ -26,5 +26,15 @@ def filter_data(df: pd.DataFrame) -> pd.DataFrame:
     # Check auf fehlende Werte
     df = df.dropna(subset=["Company Name", "GovernancePillarScore", "Close Price (USD)", "Year"])
 
+    # Gruppierungsschlüssel als Kategorien (Integer-Codes statt String-Hashing)
+    for col in ("Company Name", "Sector", "Sektor"):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    df["Year"] = df["Year"].astype("int16")
+
+    # Kennzahlen in einfacher Genauigkeit (halbiert den Speicherbedarf)
+    for col in ("Close Price (USD)", "GovernancePillarScore"):
+        df[col] = df[col].astype("float32")
+
     return df
 
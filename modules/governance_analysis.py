@@ -15,7 +15,7 @@ def governance_analysis_view(df: pd.DataFrame):
     selected_years = st.multiselect("Analysejahre", options=years, default=years)
 
     # Datenfilterung
-    df_filtered = df[df["Year"].isin(selected_years)].copy()
+    df_filtered = df[df["Year"].isin(selected_years)]
 
     # Prüfung auf notewendige Spalten
     cols_needed = ["GovernancePillarScore", "AnnualReturnPct", "Company Name"]
@@ -24,8 +24,9 @@ def governance_analysis_view(df: pd.DataFrame):
         return
 
     # Bereinigung auf valide numerische Werte
-    df_filtered["GovernancePillarScore"] = pd.to_numeric(df_filtered["GovernancePillarScore"], errors="coerce")
-    df_filtered["AnnualReturnPct"] = pd.to_numeric(df_filtered["AnnualReturnPct"], errors="coerce")
+    for col in ("GovernancePillarScore", "AnnualReturnPct"):
+        if not pd.api.types.is_numeric_dtype(df_filtered[col]):
+            df_filtered[col] = pd.to_numeric(df_filtered[col], errors="coerce")
     df_filtered.dropna(subset=["GovernancePillarScore", "AnnualReturnPct"], inplace=True)
 
     if df_filtered.empty:
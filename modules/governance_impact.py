@@ -1,8 +1,117 @@
 import math
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-from scipy.stats import linregress
+import plotly.graph_objects as go
+from modules.calculations import data_version, grouped_centered_sums, pearson_from_sums
+
+REQUIRED_COLUMNS = ["Company Name", "GovernancePillarScore", "AnnualReturnPct", "Year", "Sector"]
+
+@st.cache_data(show_spinner=False)
+def _prepare(_df: pd.DataFrame, version: str, clip_mode: str) -> tuple:
+    """
+    Bereinigte, um Ausreißer gekürzte Daten und sortierte Sektorliste.
+    """
+    # Schlüssel ist die Datenversion, der Frame selbst wird nicht gehasht
+    df = _df[REQUIRED_COLUMNS].dropna(subset=REQUIRED_COLUMNS)
+    for col in ("AnnualReturnPct", "GovernancePillarScore"):
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = df.dropna(subset=["AnnualReturnPct", "GovernancePillarScore"])
+
+    if clip_mode == "hard":
+        df = df[df["AnnualReturnPct"].between(-100, 100)]
+    elif clip_mode == "quantile":
+        q01, q99 = df["AnnualReturnPct"].quantile([0.01, 0.99])
+        df = df[df["AnnualReturnPct"].between(q01, q99)]
+
+    sektoren = sorted(df["Sector"].dropna().unique())
+    return df, sektoren
+
+def _trendlines(df_small: pd.DataFrame, group_col: str | None) -> pd.DataFrame:
+    """
+    Endpunkte der linearen Regressionsgeraden je Gruppe (ersetzt trendline="ols").
+    """
+    keys = df_small[group_col] if group_col else pd.Series(0, index=df_small.index)
+    sums = grouped_centered_sums(keys, df_small["GovernancePillarScore"], df_small["AnnualReturnPct"])
+    sums = sums[sums["x_max"] > sums["x_min"]]
+
+    # Kleinste-Quadrate-Gerade aus den Gruppensummen, Achsenabschnitt über die Mittelwerte
+    slope = sums["sxy"] / sums["sxx"]
+    intercept = sums["y_mean"] - slope * sums["x_mean"]
+    return pd.DataFrame({
+        "Gruppe": sums.index.to_numpy() if group_col else [None] * len(sums),
+        "x0": sums["x_min"].to_numpy(),
+        "x1": sums["x_max"].to_numpy(),
+        "y0": (intercept + slope * sums["x_min"]).to_numpy(),
+        "y1": (intercept + slope * sums["x_max"]).to_numpy(),
+    })
+
+def _return_stats(ret: pd.Series) -> pd.DataFrame:
+    """
+    Lage- und Streuungsmaße der Jahresrendite.
+    """
+    stats = ret.agg(
+        Mittelwert="mean", Median="median", StdAbw="std",
+        Minimum="min", Maximum="max", N="count"
+    ).round(2).to_frame().T
+    stats.index = ["Jahresrendite (%)"]
+    return stats
+
+def _histogram(values: pd.Series, nbins: int = 40) -> tuple:
+    """
+    Häufigkeiten und Klassengrenzen für ein Histogramm.
+    """
+    counts, edges = np.histogram(values.to_numpy(dtype="float64"), bins=nbins)
+    return counts, edges
+
+def _ols_from_sums(n, sxx, syy, sxy) -> tuple:
+    """
+    Steigung, r, p und Standardfehler aus zentrierten Quadratsummen (wie scipy.stats.linregress).
+    """
+    r, p = pearson_from_sums(n, sxx, syy, sxy)
+    dof = np.asarray(n) - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        # Zwei Punkte: keine Freiheitsgrade, p und Standardfehler wie bei linregress
+        p = np.where(dof > 0, p, np.where(syy == 0, 1.0, 0.0))
+        stderr = np.where(dof > 0, np.sqrt((1.0 - r * r) * syy / sxx / dof), 0.0)
+    return slope, r, p, stderr
+
+def _regression(x: np.ndarray, y: np.ndarray) -> tuple | None:
+    """
+    Steigung, Achsenabschnitt, r, p und Standardfehler der linearen Regression.
+    """
+    if x.max() == x.min():
+        return None
+    dx = x - x.mean()
+    dy = y - y.mean()
+    slope, r, p, stderr = _ols_from_sums(x.size, dx @ dx, dy @ dy, dx @ dy)
+    return float(slope), float(y.mean() - slope * x.mean()), float(r), float(p), float(stderr)
+
+@st.cache_data(show_spinner=False)
+def _group_regressions(df_small: pd.DataFrame, group_col: str) -> pd.DataFrame:
+    """
+    Regressionskennzahlen je Gruppe (Sektor oder Unternehmen).
+    """
+    df_small = df_small.dropna(subset=["GovernancePillarScore", "AnnualReturnPct"])
+    # Gruppen in sortierter Reihenfolge anzeigen
+    sums = grouped_centered_sums(
+        df_small[group_col], df_small["GovernancePillarScore"], df_small["AnnualReturnPct"]
+    ).sort_index()
+    sums = sums[(sums["n"] >= 2) & (sums["x_max"] > sums["x_min"])]
+
+    slope, r, p, _ = _ols_from_sums(
+        sums["n"].to_numpy(), sums["sxx"].to_numpy(), sums["syy"].to_numpy(), sums["sxy"].to_numpy()
+    )
+    return pd.DataFrame({
+        "Gruppe": sums.index.to_numpy(),
+        "r": np.round(r, 3),
+        "Steigung": np.round(slope, 4),
+        "p": [f"{v:.3g}" for v in p],
+        "N": sums["n"].to_numpy()
+    })
 
 def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
     """
@@ -15,25 +124,14 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
     if "Sektor" in df.columns and "Sector" not in df.columns:
         df = df.rename(columns={"Sektor": "Sector"})
 
-    required = ["Company Name", "GovernancePillarScore", "AnnualReturnPct", "Year", "Sector"]
-    if not all(col in df.columns for col in required):
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
         st.error("Für diese Analyse fehlen eine oder mehrere Spalten (erwartet: Company Name, GovernancePillarScore, AnnualReturnPct, Year, Sector).")
         return
 
-    # Säubern & Typisieren
-    df = df.dropna(subset=required).copy()
-    df["AnnualReturnPct"] = pd.to_numeric(df["AnnualReturnPct"], errors="coerce")
-    df["GovernancePillarScore"] = pd.to_numeric(df["GovernancePillarScore"], errors="coerce")
-    df = df.dropna(subset=["AnnualReturnPct", "GovernancePillarScore"])
-
-    if clip_mode == "hard":
-        df = df[df["AnnualReturnPct"].between(-100, 100)]
-    elif clip_mode == "quantile":
-        q01, q99 = df["AnnualReturnPct"].quantile([0.01, 0.99])
-        df = df[df["AnnualReturnPct"].between(q01, q99)]
+    # Säubern, Typisieren & Ausreißer kürzen
+    df, sektoren = _prepare(df, data_version(df), clip_mode)
 
     # Auswahl der Sektoren
-    sektoren = sorted(df["Sector"].dropna().unique())
     selected_sektoren = st.multiselect("Sektoren auswählen", sektoren, default=sektoren)
     if not selected_sektoren:
         st.warning("Bitte mindestens einen Sektor auswählen.")
@@ -50,18 +148,18 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
         if not selected:
             st.warning("Bitte mindestens ein Unternehmen auswählen.")
             return
-        df_filtered = df[df["Company Name"].isin(selected)].copy()
+        df_filtered = df[df["Company Name"].isin(selected)]
         color_col = "Company Name"
         multi_trend = True
     elif modus == "Sektordurchschnitte":
         df_filtered = (
-            df.groupby(["Year", "Sector"], as_index=False)
+            df.groupby(["Year", "Sector"], as_index=False, sort=False, observed=True)
               .agg({"GovernancePillarScore": "mean", "AnnualReturnPct": "mean"})
         )
         color_col = "Sector"
         multi_trend = True
     else:
-        df_filtered = df.copy()
+        df_filtered = df
         color_col = None
         multi_trend = False
 
@@ -71,7 +169,7 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
 
     # Y-Achsenbereich
     scale_all = st.checkbox("Alle Werte anzeigen", value=False)
-    ret = pd.to_numeric(df_filtered["AnnualReturnPct"], errors="coerce").dropna()
+    ret = df_filtered["AnnualReturnPct"].dropna()
     if ret.empty:
         y_min, y_max = -20.0, 20.0
     elif scale_all:
@@ -88,27 +186,43 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
         y_min, y_max = -R, R
 
     # Regressionskennzahlen
-    x = pd.to_numeric(df_filtered["GovernancePillarScore"], errors="coerce")
-    y = pd.to_numeric(df_filtered["AnnualReturnPct"], errors="coerce")
+    x = df_filtered["GovernancePillarScore"]
+    y = df_filtered["AnnualReturnPct"]
     mask = x.notna() & y.notna()
+    result = None
     if mask.sum() >= 2:
-        slope, intercept, r_value, p_value, std_err = linregress(x[mask], y[mask])
+        result = _regression(x[mask].to_numpy(dtype="float64"), y[mask].to_numpy(dtype="float64"))
+    if result is not None:
+        slope, intercept, r_value, p_value, std_err = result
         title_r = f"{r_value:.2f}"
         title_slope = f"{slope:.3f}"
         title_p = f"{p_value:.3g}"
     else:
         title_r = title_slope = title_p = "-"
+        r_value = p_value = None
 
     fig = px.scatter(
         df_filtered,
         x="GovernancePillarScore",
         y="AnnualReturnPct",
         color=color_col if multi_trend else None,
-        trendline="ols",
-        hover_data=df_filtered.columns,
+        hover_data=[c for c in ("Company Name", "Sector", "Year") if c in df_filtered.columns],
+        render_mode="webgl",
         opacity=0.6 if show_points else 0.0,
         title=f"Governance-Score vs. Jahresrendite (global: r = {title_r}, Steigung {title_slope} %-Pkt/Scorepunkt, p = {title_p})"
     )
+
+    # Regressionsgeraden je Gruppe in der Farbe der zugehörigen Punkte
+    trend_col = color_col if multi_trend else None
+    trend_cols = ([trend_col] if trend_col else []) + ["GovernancePillarScore", "AnnualReturnPct"]
+    colors = {trace.name: trace.marker.color for trace in fig.data}
+    for row in _trendlines(df_filtered[trend_cols], trend_col).itertuples(index=False):
+        name = "" if row.Gruppe is None else str(row.Gruppe)
+        fig.add_trace(go.Scattergl(
+            x=[row.x0, row.x1], y=[row.y0, row.y1],
+            mode="lines", line=dict(color=colors.get(name)),
+            legendgroup=name, showlegend=False, hoverinfo="skip"
+        ))
     fig.add_hline(y=0, line_dash="dot", line_width=1)
 
     fig.update_layout(
@@ -127,11 +241,7 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
     st.plotly_chart(fig, use_container_width=True)
 
     # Kennzahlen
-    stats = df_filtered["AnnualReturnPct"].agg(
-        Mittelwert="mean", Median="median", StdAbw="std",
-        Minimum="min", Maximum="max", N="count"
-    ).round(2).to_frame().T
-    stats.index = ["Jahresrendite (%)"]
+    stats = _return_stats(df_filtered["AnnualReturnPct"])
     st.markdown("### Statistische Kennzahlen")
     st.dataframe(stats)
 
@@ -150,16 +260,16 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
 
         # Histogramm Jahresrendite
         with col1:
-            ret_series = pd.to_numeric(df_filtered["AnnualReturnPct"], errors="coerce").dropna()
+            ret_series = df_filtered["AnnualReturnPct"].dropna()
             if not ret_series.empty:
-                fig_hist_ret = px.histogram(
-                    ret_series.to_frame(name="AnnualReturnPct"),
-                    x="AnnualReturnPct",
-                    nbins=40,
-                    title="Verteilung: Jahresrendite"
-                )
+                counts, edges = _histogram(ret_series)
+                fig_hist_ret = go.Figure(go.Bar(
+                    x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges)
+                ))
                 fig_hist_ret.update_layout(
+                    title="Verteilung: Jahresrendite",
                     height=350,
+                    bargap=0,
                     xaxis_title="Rendite (%)",
                     yaxis_title="Häufigkeit",
                     plot_bgcolor="rgba(0,0,0,0)",
@@ -172,16 +282,16 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
 
         # Histogramm Governance-Score
         with col2:
-            gov_series = pd.to_numeric(df_filtered["GovernancePillarScore"], errors="coerce").dropna()
+            gov_series = df_filtered["GovernancePillarScore"].dropna()
             if not gov_series.empty:
-                fig_hist_gov = px.histogram(
-                    gov_series.to_frame(name="GovernancePillarScore"),
-                    x="GovernancePillarScore",
-                    nbins=40,
-                    title="Verteilung: Governance-Score"
-                )
+                counts, edges = _histogram(gov_series)
+                fig_hist_gov = go.Figure(go.Bar(
+                    x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges)
+                ))
                 fig_hist_gov.update_layout(
+                    title="Verteilung: Governance-Score",
                     height=350,
+                    bargap=0,
                     xaxis_title="Governance-Score",
                     yaxis_title="Häufigkeit",
                     plot_bgcolor="rgba(0,0,0,0)",
@@ -194,14 +304,9 @@ def governance_vs_rendite(df: pd.DataFrame, clip_mode: str = "quantile"):
     # Gruppenspezifische Kennzahlen
     if multi_trend and st.checkbox("Gruppenspezifische Regressionsstatistik anzeigen", value=False):
         group_col = color_col
-        out_rows = []
-        for key, g in df_filtered.groupby(group_col):
-            xx = pd.to_numeric(g["GovernancePillarScore"], errors="coerce")
-            yy = pd.to_numeric(g["AnnualReturnPct"], errors="coerce")
-            m = xx.notna() & yy.notna()
-            if m.sum() >= 2:
-                sl, itc, r, p, se = linregress(xx[m], yy[m])
-                out_rows.append({"Gruppe": key, "r": round(r, 3), "Steigung": round(sl, 4), "p": f"{p:.3g}", "N": int(m.sum())})
-        if out_rows:
+        df_groups = _group_regressions(
+            df_filtered[[group_col, "GovernancePillarScore", "AnnualReturnPct"]], group_col
+        )
+        if not df_groups.empty:
             st.markdown("### Regressionsstatistik je Gruppe")
-            st.dataframe(pd.DataFrame(out_rows))
\ No newline at end of file
+            st.dataframe(df_groups)
\ No newline at end of file
@@ -1,10 +1,106 @@
 import math
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
-from scipy.stats import pearsonr
+from modules.calculations import data_version, pearson_from_sums
 
+COMPANY_COLUMNS = ["Year", "GovernancePillarScore", "AnnualReturnPct", "Company Name"]
+SECTOR_COLUMNS = ["Year", "Sektor", "GovernancePillarScore", "AnnualReturnPct"]
+
+# Interpretation nach Vorzeichen von r (0 = nicht signifikant auf 5 %-Niveau)
+INTERPRETATIONS = {
+    1: "signifikanter positiver Zusammenhang",
+    -1: "signifikanter negativer Zusammenhang",
+    0: "kein statistisch signifikanter Zusammenhang",
+}
+
+@st.cache_data(show_spinner=False)
+def _sorted_options(_df: pd.DataFrame, version: str, column: str) -> list:
+    """
+    Sortierte, eindeutige Auswahlwerte für die Multiselects.
+    """
+    return sorted(_df[column].dropna().unique())
+
+@st.cache_data(show_spinner=False)
+def _prepare_company_frame(_df: pd.DataFrame, version: str, selected: tuple) -> tuple:
+    """
+    Bereinigte Zeitreihen der gewählten Unternehmen samt Achsenbereichen.
+    """
+    # Schlüssel ist die Datenversion, der Frame selbst wird nicht gehasht
+    df_filtered = _df.loc[_df["Company Name"].isin(selected), COMPANY_COLUMNS]
+    # Kennzahlen einmalig numerisch machen, danach ohne weitere Umwandlung
+    for col in ("GovernancePillarScore", "AnnualReturnPct"):
+        if not pd.api.types.is_numeric_dtype(df_filtered[col]):
+            df_filtered[col] = pd.to_numeric(df_filtered[col], errors="coerce")
+    # Nach Unternehmen und Jahr sortiert liegt jede Zeitreihe zusammenhängend im Frame
+    df_filtered = df_filtered.dropna().sort_values(["Company Name", "Year"], kind="stable")
+    if df_filtered.empty:
+        return df_filtered, None
+
+    # Anpassung der Renditeachse
+    ret_all = df_filtered["AnnualReturnPct"].to_numpy(dtype="float64")
+    if ret_all.size:
+        # Quantile und Extremwerte in einem Aufruf
+        q_low, q_high, real_min, real_max = (float(q) for q in np.percentile(ret_all, (5, 95, 0, 100)))
+        pad = max(5.0, 0.1 * (q_high - q_low))
+
+        y2_min = float(min(q_low - pad, 0.0))
+        y2_max = float(max(q_high + pad, 0.0))
+        y2_min = min(y2_min, real_min)
+        y2_max = max(y2_max, real_max)
+    else:
+        y2_min, y2_max = -10.0, 10.0
+
+    step = 5.0
+    y2_min = math.floor(y2_min / step) * step
+    y2_max = math.ceil(y2_max / step) * step
+    if y2_max - y2_min < step:  # Sicherheitsabstand
+        y2_min -= step
+        y2_max += step
+
+    years = df_filtered["Year"].to_numpy()
+    x_min, x_max = int(years.min()), int(years.max())
+    return df_filtered, (x_min, x_max, y2_min, y2_max)
+
+@st.cache_data(show_spinner=False)
+def _company_corrs(df_filtered: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pearson-Korrelation, p-Wert und Anzahl Beobachtungen je Unternehmen.
+    """
+    # Der Frame ist nach Unternehmen sortiert, jede Gruppe ist ein zusammenhängender Block
+    codes = df_filtered["Company Name"].cat.codes.to_numpy()
+    x = df_filtered["GovernancePillarScore"].to_numpy(dtype="float64")
+    y = df_filtered["AnnualReturnPct"].to_numpy(dtype="float64")
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    n = np.diff(np.r_[starts, len(codes)])
+
+    # Abweichungen vom Unternehmensmittel, danach Summen je Block
+    dx = x - np.repeat(np.add.reduceat(x, starts) / n, n)
+    dy = y - np.repeat(np.add.reduceat(y, starts) / n, n)
+    r, p = pearson_from_sums(
+        n, np.add.reduceat(dx * dx, starts), np.add.reduceat(dy * dy, starts), np.add.reduceat(dx * dy, starts)
+    )
+    return pd.DataFrame({"r": r, "p": p, "n": n}, index=df_filtered["Company Name"].to_numpy()[starts])
+
+@st.cache_data(show_spinner=False)
+def _prepare_sector_grouped(_df: pd.DataFrame, version: str, selected_sectors: tuple) -> pd.DataFrame:
+    """
+    Mittelwerte von Governance-Score und Rendite je Jahr und Sektor.
+    """
+    df_sector = _df.loc[_df["Sektor"].isin(selected_sectors), SECTOR_COLUMNS]
+    df_sector = df_sector.dropna(subset=SECTOR_COLUMNS)
+
+    # Sortierung beibehalten: px.line verbindet die Punkte in Zeilenreihenfolge
+    return (
+        df_sector.groupby(["Year", "Sektor"], observed=True, as_index=False)
+        [["GovernancePillarScore", "AnnualReturnPct"]]
+        .mean()
+    )
+
+# Als Fragment: Widgets dieses Tabs führen nur diese Funktion erneut aus, nicht das ganze Skript
+@st.fragment
 def governance_timeseries(df: pd.DataFrame):
     """
     Visualisierung der Entwicklung von Governance-Scores und Jahresrenditen im Zeitverlauf.
@@ -12,67 +108,62 @@ def governance_timeseries(df: pd.DataFrame):
 
     st.subheader("Zeitliche Entwicklung von Governance-Score und Rendite")
 
+    # Schlüsselspalten als Kategorien, falls sie nicht schon beim Laden umgewandelt wurden
+    cat_cols = {
+        c: df[c].astype("category") for c in ("Company Name", "Sektor")
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)
+    }
+    if cat_cols:
+        df = df.assign(**cat_cols)
+
+    version = data_version(df)
+
     modus = st.radio("Darstellungsmodus", ["Einzelunternehmen", "Sektortrends"], horizontal=True)
 
     if modus == "Einzelunternehmen":
-        companies = df["Company Name"].dropna().unique()
-        selected = st.multiselect("Unternehmen auswählen", sorted(companies), default=sorted(companies)[:1])
+        companies = _sorted_options(df, version, "Company Name")
+        selected = st.multiselect("Unternehmen auswählen", companies, default=companies[:1])
 
         if not selected:
             st.warning("Bitte mindestens ein Unternehmen auswählen.")
             return
 
-        df_filtered = df[df["Company Name"].isin(selected)]
-        cols_needed = ["Year", "GovernancePillarScore", "AnnualReturnPct", "Company Name"]
-        if not all(col in df_filtered.columns for col in cols_needed):
+        if not all(col in df.columns for col in COMPANY_COLUMNS):
             st.error("Fehlende Spalten – erforderlich: Year, GovernancePillarScore, AnnualReturnPct, Company Name")
             return
 
-        df_filtered = df_filtered[cols_needed].dropna().sort_values("Year")
+        df_filtered, ranges = _prepare_company_frame(df, version, tuple(selected))
         if df_filtered.empty:
             st.warning("Keine gültigen Daten gefunden.")
             return
+        x_min, x_max, y2_min, y2_max = ranges
 
-        # Anpassung der Renditeachse
-        ret_all = pd.to_numeric(df_filtered["AnnualReturnPct"], errors="coerce")
-        if ret_all.notna().any():
-            q_low = float(ret_all.quantile(0.05))
-            q_high = float(ret_all.quantile(0.95))
-            pad = max(5.0, 0.1 * (q_high - q_low))
-
-            y2_min = float(min(q_low - pad, 0.0))
-            y2_max = float(max(q_high + pad, 0.0))
-
-            real_min = float(ret_all.min())
-            real_max = float(ret_all.max())
-            y2_min = min(y2_min, real_min)
-            y2_max = max(y2_max, real_max)
-        else:
-            y2_min, y2_max = -10.0, 10.0
-
-        step = 5.0
-        y2_min = math.floor(y2_min / step) * step
-        y2_max = math.ceil(y2_max / step) * step
-        if y2_max - y2_min < step:  # Sicherheitsabstand
-            y2_min -= step
-            y2_max += step
-
-        x_min = int(df_filtered["Year"].min())
-        x_max = int(df_filtered["Year"].max())
+        # Zeilenbereiche je Unternehmen über die sortierten Kategorie-Codes
+        names = df_filtered["Company Name"]
+        codes = names.cat.codes.to_numpy()
+        firm_codes = names.cat.categories.get_indexer(selected)
+        starts = np.searchsorted(codes, firm_codes, side="left")
+        ends = np.searchsorted(codes, firm_codes, side="right")
+        bounds = list(zip(selected, starts, ends))
+
+        # Spalten einmal als zusammenhängende Arrays, die Spuren sind Ausschnitte daraus;
+        # int16/float32 halten die an den Browser übertragenen Daten klein
+        years = np.ascontiguousarray(df_filtered["Year"].to_numpy(dtype="int16"))
+        gov = np.ascontiguousarray(df_filtered["GovernancePillarScore"].to_numpy(dtype="float32"))
+        ret = np.ascontiguousarray(df_filtered["AnnualReturnPct"].to_numpy(dtype="float32"))
 
         fig = go.Figure()
-        for firm in selected:
-            data = df_filtered[df_filtered["Company Name"] == firm]
-            fig.add_trace(go.Scatter(
-                x=data["Year"],
-                y=data["GovernancePillarScore"],
+        for firm, a, b in bounds:
+            fig.add_trace(go.Scattergl(
+                x=years[a:b],
+                y=gov[a:b],
                 name=f"{firm} – Governance-Score",
                 mode="lines+markers",
                 yaxis="y1"
             ))
-            fig.add_trace(go.Scatter(
-                x=data["Year"],
-                y=data["AnnualReturnPct"],
+            fig.add_trace(go.Scattergl(
+                x=years[a:b],
+                y=ret[a:b],
                 name=f"{firm} – Jahresrendite (%)",
                 mode="lines+markers",
                 yaxis="y2",
@@ -103,24 +194,17 @@ def governance_timeseries(df: pd.DataFrame):
             legend=dict(x=0.01, y=0.99),
             height=600
         )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True, key="gov_timeseries_chart")
 
         # Korrelation und kurze Interpretation
-        for firm in selected:
-            sub = df_filtered[df_filtered["Company Name"] == firm][["GovernancePillarScore", "AnnualReturnPct"]].copy()
-            sub = sub.apply(pd.to_numeric, errors="coerce").dropna()
-            n = len(sub)
+        corrs = _company_corrs(df_filtered).reindex(list(selected))
+        n_arr = corrs["n"].fillna(0).to_numpy(dtype="int64")
+        r_arr = corrs["r"].to_numpy()
+        p_arr = corrs["p"].to_numpy()
+        outcome = np.where(p_arr < 0.05, np.sign(r_arr), 0).astype("int64")
+        for firm, n, r_val, p_val, o in zip(selected, n_arr, r_arr, p_arr, outcome):
             if n >= 3:
-                r, p = pearsonr(sub["GovernancePillarScore"], sub["AnnualReturnPct"])
-                r_val = float(r)
-                p_val = float(p)
-                if p_val < 0.05 and r_val > 0:
-                    interp = "signifikanter positiver Zusammenhang"
-                elif p_val < 0.05 and r_val < 0:
-                    interp = "signifikanter negativer Zusammenhang"
-                else:
-                    interp = "kein statistisch signifikanter Zusammenhang"
-                st.info(f"{firm}: r = {r_val:.2f}, p = {p_val:.3f}, n = {n} – {interp}.")
+                st.info(f"{firm}: r = {r_val:.2f}, p = {p_val:.3f}, n = {n} – {INTERPRETATIONS[o]}.")
             else:
                 st.info(f"{firm}: zu wenige Beobachtungen für eine belastbare Korrelation (n = {n}).")
         st.markdown(
@@ -137,41 +221,39 @@ def governance_timeseries(df: pd.DataFrame):
         )
 
     elif modus == "Sektortrends":
-        sektoren = df["Sektor"].dropna().unique()
-        selected_sectors = st.multiselect("Sektoren auswählen", sorted(sektoren), default=sorted(sektoren)[:3])
+        sektoren = _sorted_options(df, version, "Sektor")
+        selected_sectors = st.multiselect("Sektoren auswählen", sektoren, default=sektoren[:3])
 
         if not selected_sectors:
             st.warning("Bitte mindestens einen Sektor auswählen.")
             return
 
-        df_sector = df[df["Sektor"].isin(selected_sectors)].copy()
-        df_sector = df_sector.dropna(subset=["Year", "Sektor", "GovernancePillarScore", "AnnualReturnPct"])
+        df_grouped = _prepare_sector_grouped(df, version, tuple(selected_sectors))
 
-        df_grouped = (
-            df_sector.groupby(["Year", "Sektor"])
-            .agg({
-                "GovernancePillarScore": "mean",
-                "AnnualReturnPct": "mean"
-            })
-            .reset_index()
+        # Beide Kennzahlen als Facetten einer Figur
+        metrics = {"GovernancePillarScore": "Governance-Score", "AnnualReturnPct": "Rendite (%)"}
+        df_long = df_grouped.melt(
+            id_vars=["Year", "Sektor"],
+            value_vars=list(metrics),
+            var_name="Kennzahl",
+            value_name="Wert"
         )
+        df_long["Kennzahl"] = df_long["Kennzahl"].map(metrics)
 
-        fig_score = px.line(
-            df_grouped,
+        fig = px.line(
+            df_long,
             x="Year",
-            y="GovernancePillarScore",
+            y="Wert",
             color="Sektor",
-            title="Sektorale Entwicklung der Governance-Scores"
+            facet_row="Kennzahl",
+            category_orders={"Kennzahl": list(metrics.values())},
+            render_mode="webgl",
+            title="Sektorale Entwicklung der Governance-Scores und Jahresrenditen"
         )
-        fig_score.update_layout(yaxis_title="Governance-Score", height=400)
-        st.plotly_chart(fig_score, use_container_width=True)
-
-        fig_return = px.line(
-            df_grouped,
-            x="Year",
-            y="AnnualReturnPct",
-            color="Sektor",
-            title="Sektorale Entwicklung der Jahresrenditen"
-        )
-        fig_return.update_layout(yaxis_title="Rendite (%)", height=400, yaxis=dict(ticksuffix=" %"))
-        st.plotly_chart(fig_return, use_container_width=True)
\ No newline at end of file
+        # Plotly Express zählt die Facettenzeilen von unten
+        fig.update_yaxes(matches=None)
+        fig.update_yaxes(title_text="Governance-Score", row=2, col=1)
+        fig.update_yaxes(title_text="Rendite (%)", ticksuffix=" %", row=1, col=1)
+        fig.layout.annotations = ()
+        fig.update_layout(height=800)
+        st.plotly_chart(fig, use_container_width=True)